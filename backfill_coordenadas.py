@@ -0,0 +1,59 @@
+import os
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from geopy.geocoders import Nominatim
+from geopy.extra.rate_limiter import RateLimiter
+import certifi
+
+# ==============================================================================
+# PREENCHIMENTO DE LATITUDE/LONGITUDE NAS LOCALIZAÇÕES
+# ==============================================================================
+# Script executado uma única vez (ou quando novas localizações forem
+# cadastradas). Grava latitude/longitude em cada documento de `localizacoes`
+# para que o dashboard não precise geocodificar endereços em tempo de execução.
+
+def main():
+    load_dotenv(dotenv_path=".env")
+
+    uri = os.getenv('MONGO_URI')
+    db_name = os.getenv('DB_NAME')
+
+    if not uri:
+        print("A variável MONGO_URI não foi encontrada no .env")
+        return
+
+    client = MongoClient(uri, tlsCAFile=certifi.where())
+    db = client[db_name]
+
+    geolocator = Nominatim(user_agent="dino_app_mongo")
+    # Respeita a política do Nominatim (1 requisição por segundo)
+    geocode = RateLimiter(geolocator.geocode, min_delay_seconds=1)
+
+    # Só processa localizações que ainda não possuem coordenadas
+    pendentes = db.localizacoes.find(
+        {"$or": [{"latitude": {"$exists": False}}, {"longitude": {"$exists": False}}]},
+        {"cidade": 1, "pais": 1}
+    )
+
+    atualizados = 0
+    for loc in pendentes:
+        if not loc.get("cidade") or not loc.get("pais"):
+            continue
+
+        endereco = f"{loc['cidade']}, {loc['pais']}"
+        location = geocode(endereco, timeout=10)
+        if not location:
+            print(f"Endereço não encontrado: {endereco}")
+            continue
+
+        db.localizacoes.update_one(
+            {"_id": loc["_id"]},
+            {"$set": {"latitude": location.latitude, "longitude": location.longitude}}
+        )
+        atualizados += 1
+        print(f"{endereco}: ({location.latitude}, {location.longitude})")
+
+    print(f"{atualizados} localizações atualizadas.")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,11 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 from dotenv import load_dotenv
 import os
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure, PyMongoError
 from bson import ObjectId
-from geopy.geocoders import Nominatim
 import certifi
 
 st.set_page_config(
@@ -22,6 +21,15 @@ st.markdown("Dashboard interativo sobre dinossauros utilizando dados de um banco
 # ==============================================================================
 # CONEXÃO COM O MONGODB
 # ==============================================================================
+# Caminho do bundle de certificados resolvido uma única vez, na importação
+_CA_FILE = certifi.where()
+
+# Mesma collation no índice e na consulta para que o sort use o índice
+NOME_COLLATION = {"locale": "pt", "strength": 2}
+
+# Unauthorized (13), IndexOptionsConflict (85) e IndexKeySpecsConflict (86)
+INDEX_ERROS_TOLERADOS = {13, 85, 86}
+
 @st.cache_resource
 def init_connection():
     load_dotenv(dotenv_path=".env")
@@ -36,67 +44,99 @@ def init_connection():
     try:
         # --- AQUI ESTÁ A CORREÇÃO MÁGICA ---
         # O tlsCAFile força o uso dos certificados atualizados do pacote certifi
-        ca = certifi.where()
-        client = MongoClient(uri, tlsCAFile=ca)
+        client = MongoClient(
+            uri,
+            tlsCAFile=_CA_FILE,
+            # Pool persistente: as consultas reaproveitam conexões já autenticadas
+            maxPoolSize=10,
+            minPoolSize=2,
+            serverSelectionTimeoutMS=3000,
+            # Compressão no protocolo: zstd (pacote zstandard) com zlib de reserva
+            compressors="zstd,zlib"
+        )
         # ------------------------------------
         
-        client.admin.command('ping')
-        return client[db_name]
+        # O ping custa uma ida e volta ao servidor; só é feito se solicitado
+        if os.getenv('MONGO_PING') == '1':
+            client.admin.command('ping')
+        db = client[db_name]
     except Exception as e:
         st.error(f"Erro na conexão com MongoDB: {e}")
         return None
 
+    # Índices nos campos usados pelos $lookup e pelo sort da lista de nomes
+    # (create_index é idempotente; os _id já são indexados automaticamente).
+    # São só uma otimização: sem permissão ou com conflito, o app segue sem eles
+    try:
+        db.fosseis.create_index("id_dinossauro")
+        db.ossos.create_index("id_fossil")
+        # Nome explícito para não conflitar com um índice simples "nome_popular_1"
+        db.dinossauros.create_index("nome_popular", name="nome_popular_pt", collation=NOME_COLLATION)
+    except PyMongoError as e:
+        # Só falta de permissão ou conflito de índice são toleráveis; sem o
+        # ping, este é o primeiro acesso ao servidor, então erros de
+        # autenticação ou de rede aparecem aqui e são erros de conexão
+        if isinstance(e, OperationFailure) and e.code in INDEX_ERROS_TOLERADOS:
+            print(f"Aviso: não foi possível criar os índices: {e}")
+        else:
+            st.error(f"Erro na conexão com MongoDB: {e}")
+            return None
+
+    return db
+
 db = init_connection()
 
 # ==============================================================================
 # FUNÇÕES DE BUSCA DE DADOS
 # ==============================================================================
 
-def get_dinosaur_names():
-    if db is None: return []
-    
-    # Busca apenas os campos necessários e converte _id para string
-    cursor = db.dinossauros.find({}, {"_id": 1, "nome_popular": 1}).sort("nome_popular", 1)
-    
-    lista_dinos = []
-    for doc in cursor:
-        lista_dinos.append({
-            "id_dinossauro": str(doc["_id"]),
-            "nome_popular": doc.get("nome_popular", "Desconhecido")
-        })
-    return lista_dinos
-
-def get_dinosaur_by_id(dino_id_str):
-    if db is None: return None
-
-    try:
-        oid = ObjectId(dino_id_str)
-    except:
-        st.error("ID de Dinossauro inválido.")
-        return None
+# Cache único dos dados: cache_resource devolve o mesmo dicionário a cada
+# chamada (sem copiar a coleção inteira como o cache_data faria), por isso
+# o resultado é tratado como somente leitura pelas funções abaixo
+@st.cache_resource(ttl=3600, show_spinner=False)
+def load_all_dinosaurs():
+    if db is None: return {}
 
+    # A coleção é pequena: uma única agregação traz todos os dinossauros com
+    # os dados relacionados, e as trocas no selectbox viram buscas no dicionário
     pipeline = [
-        { "$match": { "_id": oid } },
+        # Já ordena pelo nome para montar a lista do selectbox
+        { "$sort": { "nome_popular": 1 } },
 
+        # Cada $lookup usa sub-pipeline com $project para que o servidor
+        # não envie campos das coleções relacionadas que a interface não usa
         {
             "$lookup": {
                 "from": "tipos_alimentacao",
-                "localField": "id_dieta",
-                "foreignField": "_id",
+                "let": { "d": "$id_dieta" },
+                "pipeline": [
+                    { "$match": { "$expr": { "$eq": ["$_id", "$$d"] } } },
+                    { "$project": { "_id": 0, "nome_dieta": 1 } }
+                ],
                 "as": "dieta_info"
             }
         },
-        { "$unwind": { "path": "$dieta_info", "preserveNullAndEmptyArrays": True } },
 
         {
             "$lookup": {
                 "from": "periodos_geologicos",
-                "localField": "id_periodo",
-                "foreignField": "_id",
+                "let": { "p": "$id_periodo" },
+                "pipeline": [
+                    { "$match": { "$expr": { "$eq": ["$_id", "$$p"] } } },
+                    { "$project": { "_id": 0, "nome_periodo": 1, "ma_inicio": 1, "ma_fim": 1, "clima": 1 } }
+                ],
                 "as": "periodo_info"
             }
         },
-        { "$unwind": { "path": "$periodo_info", "preserveNullAndEmptyArrays": True } },
+
+        # Cada lookup retorna no máximo um documento: $first extrai o elemento
+        # sem o custo de reorganizar documentos que o $unwind teria
+        {
+            "$addFields": {
+                "dieta_info": { "$first": "$dieta_info" },
+                "periodo_info": { "$first": "$periodo_info" }
+            }
+        },
 
         {
             "$lookup": {
@@ -108,8 +148,11 @@ def get_dinosaur_by_id(dino_id_str):
                     {
                         "$lookup": {
                             "from": "localizacoes",
-                            "localField": "id_localizacao_descoberta",
-                            "foreignField": "_id",
+                            "let": { "l": "$id_localizacao_descoberta" },
+                            "pipeline": [
+                                { "$match": { "$expr": { "$eq": ["$_id", "$$l"] } } },
+                                { "$project": { "_id": 0, "cidade": 1, "estado": 1, "pais": 1, "latitude": 1, "longitude": 1 } }
+                            ],
                             "as": "loc"
                         }
                     },
@@ -118,8 +161,11 @@ def get_dinosaur_by_id(dino_id_str):
                     {
                         "$lookup": {
                             "from": "descobridores",
-                            "localField": "id_descobridor",
-                            "foreignField": "_id",
+                            "let": { "ds": "$id_descobridor" },
+                            "pipeline": [
+                                { "$match": { "$expr": { "$eq": ["$_id", "$$ds"] } } },
+                                { "$project": { "_id": 0, "nome_descobridor": 1 } }
+                            ],
                             "as": "desc"
                         }
                     },
@@ -128,8 +174,11 @@ def get_dinosaur_by_id(dino_id_str):
                     {
                         "$lookup": {
                             "from": "museus",
-                            "localField": "id_museu",
-                            "foreignField": "_id",
+                            "let": { "m": "$id_museu" },
+                            "pipeline": [
+                                { "$match": { "$expr": { "$eq": ["$_id", "$$m"] } } },
+                                { "$project": { "_id": 0, "nome_museu": 1, "cidade_museu": 1, "pais_museu": 1 } }
+                            ],
                             "as": "mus"
                         }
                     },
@@ -138,24 +187,74 @@ def get_dinosaur_by_id(dino_id_str):
                     {
                         "$lookup": {
                             "from": "ossos",
-                            "localField": "_id",
-                            "foreignField": "id_fossil",
+                            "let": { "fossilId": "$_id" },
+                            "pipeline": [
+                                { "$match": { "$expr": { "$eq": ["$id_fossil", "$$fossilId"] } } },
+                                { "$project": { "_id": 0, "nome_parte": 1 } }
+                            ],
                             "as": "lista_ossos_raw"
                         }
+                    },
+
+                    # Monta o fóssil já no formato usado pela interface; $ifNull
+                    # garante as chaves mesmo quando o documento relacionado falta
+                    {
+                        "$project": {
+                            "_id": 0,
+                            "codigo": { "$ifNull": ["$codigo", None] },
+                            "data_descoberta": 1,
+                            "nome_descobridor": { "$ifNull": ["$desc.nome_descobridor", "Desconhecido"] },
+                            "local_descoberta": {
+                                "cidade": { "$ifNull": ["$loc.cidade", None] },
+                                "estado": { "$ifNull": ["$loc.estado", None] },
+                                "pais": { "$ifNull": ["$loc.pais", None] },
+                                # Coordenadas pré-calculadas por backfill_coordenadas.py
+                                "lat": { "$ifNull": ["$loc.latitude", None] },
+                                "lon": { "$ifNull": ["$loc.longitude", None] }
+                            },
+                            "museu": {
+                                "nome": { "$ifNull": ["$mus.nome_museu", None] },
+                                "cidade": { "$ifNull": ["$mus.cidade_museu", None] },
+                                "pais": { "$ifNull": ["$mus.pais_museu", None] }
+                            },
+                            # Extrai apenas o nome da parte do osso da lista de objetos ossos
+                            "ossos": { "$map": { "input": "$lista_ossos_raw", "as": "o", "in": "$$o.nome_parte" } }
+                        }
                     }
                 ],
                 "as": "lista_fosseis"
             }
+        },
+
+        # Projeção final: só trafegam pela rede os campos que o Streamlit exibe
+        {
+            "$project": {
+                "nome_popular": 1,
+                "nome_cientifico": 1,
+                "significado_nome": 1,
+                "altura_media_m": 1,
+                "comprimento_medio_m": 1,
+                "peso_medio_kg": 1,
+                "imagem": 1,
+                "dieta_info.nome_dieta": 1,
+                "periodo_info.nome_periodo": 1,
+                "periodo_info.ma_inicio": 1,
+                "periodo_info.ma_fim": 1,
+                "periodo_info.clima": 1,
+                "lista_fosseis": 1
+            }
         }
     ]
 
-    resultado = list(db.dinossauros.aggregate(pipeline))
+    # A collation em português ordena sem diferenciar maiúsculas/minúsculas
+    cursor = db.dinossauros.aggregate(pipeline, collation=NOME_COLLATION)
 
-    if not resultado:
-        return None
-
-    data = resultado[0]
+    dinossauros = {}
+    for data in cursor:
+        dinossauros[str(data["_id"])] = format_dinosaur(data)
+    return dinossauros
 
+def format_dinosaur(data):
     # Mapeamento do JSON do Mongo para a estrutura exata que o Streamlit espera
 
     dinosaur_dict = {
@@ -175,33 +274,36 @@ def get_dinosaur_by_id(dino_id_str):
         "ma_fim": data.get("periodo_info", {}).get("ma_fim"),
         "clima": data.get("periodo_info", {}).get("clima"),
         
-        "fossil": []
+        # Fósseis já chegam formatados pela agregação
+        "fossil": data.get("lista_fosseis", [])
     }
 
-    # Processa a lista de fósseis vinda do lookup
-    for f in data.get("lista_fosseis", []):
-        fossil_dict = {
-            "codigo": f.get("codigo"),
-            # Converte data para string se existir
-            "data_descoberta": f.get("data_descoberta").strftime('%Y-%m-%d') if f.get("data_descoberta") else "N/A",
-            "nome_descobridor": f.get("desc", {}).get("nome_descobridor", "Desconhecido"),
-            "local_descoberta": {
-                "cidade": f.get("loc", {}).get("cidade"),
-                "estado": f.get("loc", {}).get("estado"),
-                "pais": f.get("loc", {}).get("pais")
-            },
-            "museu": {
-                "nome": f.get("mus", {}).get("nome_museu"),
-                "cidade": f.get("mus", {}).get("cidade_museu"),
-                "pais": f.get("mus", {}).get("pais_museu")
-            },
-            # Extrai apenas o nome da parte do osso da lista de objetos ossos
-            "ossos": [o["nome_parte"] for o in f.get("lista_ossos_raw", [])]
-        }
-        dinosaur_dict["fossil"].append(fossil_dict)
+    # Converte data para string se existir
+    for f in dinosaur_dict["fossil"]:
+        f["data_descoberta"] = f["data_descoberta"].strftime('%Y-%m-%d') if f.get("data_descoberta") else "N/A"
 
     return dinosaur_dict
 
+def get_dinosaur_names():
+    # Nomes e ids saem do carregamento em lote, já na ordem alfabética
+    return [
+        {
+            "id_dinossauro": dino_id,
+            "nome_popular": dino.get("nome_popular") or "Desconhecido"
+        }
+        for dino_id, dino in load_all_dinosaurs().items()
+    ]
+
+def get_dinosaur_by_id(dino_id_str):
+    if db is None: return None
+
+    # Validação do formato sem passar pelo caminho de exceção
+    if not ObjectId.is_valid(dino_id_str):
+        st.error("ID de Dinossauro inválido.")
+        return None
+
+    return load_all_dinosaurs().get(str(ObjectId(dino_id_str)))
+
 # ==============================================================================
 # LÓGICA DA INTERFACE 
 # ==============================================================================
@@ -214,23 +316,66 @@ def create_dinosaur_selector():
         st.sidebar.warning("Nenhum dinossauro encontrado.")
         return None
 
+    # get_dinosaur_names já retorna os nomes ordenados pelo MongoDB
+    sorted_names = [d["nome_popular"] for d in dinos]
     dino_dict = {d["nome_popular"]: d["id_dinossauro"] for d in dinos}
-    sorted_names = sorted(dino_dict.keys())
     selected_name = st.sidebar.selectbox("Selecione um dinossauro", sorted_names)
     
     return dino_dict.get(selected_name)
 
+def fossils_to_dataframe(fossils):
+    df = pd.json_normalize(fossils)
+    df["ossos"] = df["ossos"].apply(lambda ossos: ", ".join(o for o in ossos if o))
+    df = df[[
+        "codigo", "data_descoberta", "nome_descobridor",
+        "local_descoberta.cidade", "local_descoberta.estado", "local_descoberta.pais",
+        "museu.nome", "ossos"
+    ]]
+    df.columns = ["Código", "Data de Descoberta", "Descobridor", "Cidade", "Estado", "País", "Museu", "Ossos"]
+    return df
+
 def plot_peso_comparativo(dino):
     maior_peso = 80000
-    df = pd.DataFrame({
-        "Peso (kg)": [dino["peso_medio_kg"], maior_peso],
-        "Categoria": [dino["nome_popular"], "Maior Peso Já Registrado"]
-    })
-    fig = px.bar(
-        df, x="Categoria", y="Peso (kg)",
-        color="Categoria", title="Peso Comparativo"
+    # Barra montada direto com graph_objects, sem DataFrame intermediário
+    fig = go.Figure(go.Bar(
+        x=[dino["nome_popular"], "Maior Peso Já Registrado"],
+        y=[dino["peso_medio_kg"], maior_peso],
+        marker_color=["#636efa", "#ef553b"]
+    ))
+    fig.update_layout(title="Peso Comparativo", yaxis_title="Peso (kg)", showlegend=False, height=300)
+    return fig
+    
+def plot_mapa_fosseis(dino):
+    lats, lons, texts = [], [], []
+    for fossil in dino["fossil"]:
+        local = fossil["local_descoberta"]
+        # Localizações sem coordenadas ainda não passaram pelo backfill
+        if local['lat'] is not None and local['lon'] is not None:
+            lats.append(local['lat'])
+            lons.append(local['lon'])
+            texts.append(f"Fóssil {fossil['codigo']}")
+
+    if not lats:
+        return None
+
+    # Um único trace com todos os pontos
+    fig = go.Figure(go.Scattergeo(
+        lat=lats,
+        lon=lons,
+        text=texts,
+        mode='markers+text',
+        marker=dict(size=10, color='red'),
+        textfont=dict(color="black"),
+        textposition="top center"
+    ))
+    fig.update_geos(
+        projection_type="orthographic",
+        showcountries=True,
+        showland=True,
+        landcolor="rgb(243, 243, 243)",
+        oceancolor="rgb(204, 224, 255)",
     )
-    fig.update_layout(showlegend=False, height=300)
+    fig.update_layout(height=500, margin={"r":0,"t":0,"l":0,"b":0})
     return fig
     
 def main():
@@ -257,12 +402,15 @@ def main():
             st.warning("Sem imagem disponível")
 
     with col2:
-        st.header(f"{dinosaur['nome_popular']}")
-        st.subheader(f"*{dinosaur['nome_cientifico']}*")
-        st.markdown(f"**Significado do Nome:** {dinosaur['significado_nome']}")
-        st.markdown(f"**Altura Média:** {dinosaur['altura_media_m']} m")
-        st.markdown(f"**Comprimento Médio:** {dinosaur['comprimento_medio_m']} m")
-        st.markdown(f"**Peso Médio:** {dinosaur['peso_medio_kg']} kg")
+        # Um único st.markdown envia o bloco inteiro em uma só mensagem
+        st.markdown(
+            f"## {dinosaur['nome_popular']}\n\n"
+            f"### *{dinosaur['nome_cientifico']}*\n\n"
+            f"**Significado do Nome:** {dinosaur['significado_nome']}\n\n"
+            f"**Altura Média:** {dinosaur['altura_media_m']} m\n\n"
+            f"**Comprimento Médio:** {dinosaur['comprimento_medio_m']} m\n\n"
+            f"**Peso Médio:** {dinosaur['peso_medio_kg']} kg"
+        )
 
     with col3:
         if(dinosaur["nome_dieta"] == "Carnívoro"):
@@ -280,75 +428,55 @@ def main():
         "Localização de Descoberta"])
     
     with tab1:
-        st.subheader(f"**{dinosaur['nome_periodo']}**")
-        st.markdown(f"**Início:** {dinosaur['ma_inicio']} Ma")
-        st.markdown(f"**Fim:** {dinosaur['ma_fim']} Ma")
-        st.markdown(f"**Clima:** {dinosaur['clima']}")
+        st.markdown(
+            f"### **{dinosaur['nome_periodo']}**\n\n"
+            f"**Início:** {dinosaur['ma_inicio']} Ma\n\n"
+            f"**Fim:** {dinosaur['ma_fim']} Ma\n\n"
+            f"**Clima:** {dinosaur['clima']}"
+        )
 
     with tab2:
         if not dinosaur["fossil"]:
             st.info("Nenhum fóssil encontrado para este dinossauro.")
         else:
-            for fossil in dinosaur["fossil"]:
-                with st.expander(f"Fóssil: {fossil['codigo']}"):
-                    st.markdown(f"**Data de Descoberta:** {fossil['data_descoberta']}")
-                    st.markdown(f"**Descobridor:** {fossil['nome_descobridor']}")
+            # Tabela única: enviada ao navegador em uma só mensagem Arrow
+            st.dataframe(fossils_to_dataframe(dinosaur["fossil"]), use_container_width=True, hide_index=True)
+
+            if st.checkbox("Mostrar detalhes por fóssil"):
+                for fossil in dinosaur["fossil"]:
+                    with st.expander(f"Fóssil: {fossil['codigo']}"):
+                        st.markdown(f"**Data de Descoberta:** {fossil['data_descoberta']}")
+                        st.markdown(f"**Descobridor:** {fossil['nome_descobridor']}")
                     
-                    local = fossil["local_descoberta"]
-                    st.markdown(f"**Local:** {local['cidade']}, {local['estado']}, {local['pais']}")
+                        local = fossil["local_descoberta"]
+                        st.markdown(f"**Local:** {local['cidade']}, {local['estado']}, {local['pais']}")
                     
-                    museu = fossil["museu"]
-                    st.markdown(f"**Museu:** {museu['nome']} ({museu['cidade']}, {museu['pais']})")
+                        museu = fossil["museu"]
+                        st.markdown(f"**Museu:** {museu['nome']} ({museu['cidade']}, {museu['pais']})")
                     
-                    if fossil["ossos"]:
-                        st.markdown("**Ossos encontrados:**")
-                        for osso in fossil["ossos"]:
-                            st.markdown(f"- {osso}")
-                    else:
-                        st.markdown("Nenhum osso registrado para este fóssil.")
+                        if fossil["ossos"]:
+                            st.markdown("**Ossos encontrados:**")
+                            for osso in fossil["ossos"]:
+                                st.markdown(f"- {osso}")
+                        else:
+                            st.markdown("Nenhum osso registrado para este fóssil.")
     
     with tab3:
         if not dinosaur["fossil"]:
             st.info("Nenhum mapa disponível (sem fósseis).")
         else:
-            fig = go.Figure()
-            geolocator = Nominatim(user_agent="dino_app_mongo")
-
-            found_location = False
-            for fossil in dinosaur["fossil"]:
-                local = fossil["local_descoberta"]
-                # Validação simples para evitar chamadas vazias
-                if local['cidade'] and local['pais']:
-                    endereco = f"{local['cidade']}, {local['pais']}"
-                    try:
-                        location = geolocator.geocode(endereco, timeout=10)
-                        if location:
-                            found_location = True
-                            lat, lon = location.latitude, location.longitude
-                            fig.add_trace(go.Scattergeo(
-                                lat=[lat],
-                                lon=[lon],
-                                text=[f"Fóssil {fossil['codigo']}"],
-                                mode='markers+text',
-                                marker=dict(size=10, color='red'),
-                                textfont=dict(color="black"),
-                                textposition="top center"
-                            ))
-                    except Exception as e:
-                        print(f"Erro geo: {e}")
-            
-            if found_location:
-                fig.update_geos(
-                    projection_type="orthographic",
-                    showcountries=True,
-                    showland=True,
-                    landcolor="rgb(243, 243, 243)",
-                    oceancolor="rgb(204, 224, 255)",
-                )
-                fig.update_layout(height=500, margin={"r":0,"t":0,"l":0,"b":0})
-                st.plotly_chart(fig)
-            else:
-                st.warning("Não foi possível gerar a localização no mapa.")
+            # O mapa só é montado depois que o usuário pede pela primeira vez;
+            # quem não abre esta aba não paga pelo gráfico a cada rerun
+            st.session_state.setdefault("map_loaded", False)
+            if not st.session_state["map_loaded"] and st.button("Carregar mapa"):
+                st.session_state["map_loaded"] = True
+
+            if st.session_state["map_loaded"]:
+                fig = plot_mapa_fosseis(dinosaur)
+                if fig is not None:
+                    st.plotly_chart(fig)
+                else:
+                    st.warning("Não foi possível gerar a localização no mapa.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file